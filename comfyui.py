@@ -1,94 +1,331 @@
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import os
-import random
+import copy
+from concurrent.futures import ThreadPoolExecutor
+import functools
+from random import getrandbits as _getrandbits
+import re
+import time
+
+# orjson可用时使用orjson，否则退回标准库json；main.py 也使用这两个函数
+try:
+    import orjson
+
+    def _json_dumps(obj, indent=True):
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj, indent=True):
+        return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode("utf-8")
+
+    _json_loads = json.loads
 
 BASE_URL = "http://127.0.0.1:8000/"
 
+# 复用同一个Session，保持与ComfyUI的keep-alive连接
+_SESSION = requests.Session()
+_SESSION.headers.update({"Connection": "keep-alive"})
+# 限制连接池大小；仅对GET等幂等请求在网关错误时重试，避免重复提交prompt
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+)
+_SESSION.mount("http://", _adapter)
+_SESSION.mount("https://", _adapter)
+
+# api_system_stats 的结果缓存：{URL: (时间戳, 结果)}
+_STATS_TTL = 1.0
+_stats_cache = {}
+
+_PLACEHOLDER_RE = re.compile(r"%(CHECKPOINT|LORA|PROMPT|WIDTH|HEIGHT|BATCH_SIZE|SEED|STEPS|CFG)%")
+
+# 占位符与设置项的对应关系
+_PLACEHOLDER_FIELDS = {
+    "CHECKPOINT": "checkpoint",
+    "LORA": "lora",
+    "PROMPT": "prompt",
+    "WIDTH": "latent_width",
+    "HEIGHT": "latent_height",
+    "BATCH_SIZE": "batch_size",
+    "SEED": "seed",
+    "STEPS": "steps",
+    "CFG": "cfg",
+}
+
+
+def _find_placeholders(workflow):
+    """扫描一次工作流，返回所有占位符所在位置 (设置项, 节点, 字段)。"""
+    patches = []
+    for node, data in workflow.items():
+        for key, value in data["inputs"].items():
+            if isinstance(value, str):
+                match = _PLACEHOLDER_RE.fullmatch(value)
+                if match:
+                    patches.append((_PLACEHOLDER_FIELDS[match.group(1)], node, key))
+    return patches
+
+
+@functools.lru_cache(maxsize=4)
+def _load_template(path):
+    """读取并缓存工作流模板，返回 (工作流, 占位符位置)。"""
+    with open(path, "rb") as f:
+        workflow = _json_loads(f.read())
+    return workflow, _find_placeholders(workflow)
+
+
+def _normalize_seed(seed):
+    """将seed统一为int；"RANDOM"、-1等表示随机的值统一为None。"""
+    if seed in ("RANDOM", "-1", -1, None, ""):
+        return None
+    try:
+        return int(seed)
+    except (TypeError, ValueError):
+        return None
+
+
 # ====================== ComfyUISettings Class ======================
 class ComfyUISettings:
     SETTINGS_DIR = "comfyui_presets"
+    _cache = {"mtime": -1, "paths": {}}
+
+    # 各字段及其类型转换函数，加载预设时据此校验
+    FIELD_TYPES = {
+        "presets_name": str,
+        "latent_width": int,
+        "latent_height": int,
+        "batch_size": int,
+        "seed": _normalize_seed,
+        "steps": int,
+        "cfg": float,
+        "checkpoint": str,
+        "lora": str,
+        "prompt": str,
+    }
+    FIELDS = tuple(FIELD_TYPES)
+    # _specialized 缓存按当前设置预先填充好的工作流，见 _build_payload
+    __slots__ = FIELDS + ("_specialized",)
+
     def __init__(self, data=None):
+        self.presets_name = "默认"
+        self.latent_width = 1216
+        self.latent_height = 832
+        self.batch_size = 1
+        self.seed = None  # 随机
+        self.steps = 20
+        self.cfg = 3.0
+        self.checkpoint = "waiNSFWIllustrious_v120.safetensors"
+        self.lora = ""
+        self.prompt = "正面提示词"
         if data:
-            self.__dict__.update(data)
-        else:
-            self.presets_name = "默认"
-            self.latent_width = 1216
-            self.latent_height = 832
-            self.batch_size = 1
-            self.seed = "RANDOM"
-            self.steps = 20
-            self.cfg = 3.0
-            self.checkpoint = "waiNSFWIllustrious_v120.safetensors"
-            self.lora = ""
-            self.prompt = "正面提示词"
+            for key, value in data.items():
+                convert = self.FIELD_TYPES.get(key)
+                # 忽略未知字段；值缺失或类型不符时保留默认值
+                if convert is None or value is None:
+                    continue
+                try:
+                    setattr(self, key, convert(value))
+                except (TypeError, ValueError):
+                    pass
+
+    def __setattr__(self, name, value):
+        if name == "seed":
+            value = _normalize_seed(value)
+        object.__setattr__(self, name, value)
+        # 任何设置变化都会使预先填充好的工作流失效
+        if name != "_specialized":
+            object.__setattr__(self, "_specialized", None)
+
+    def to_dict(self):
+        data = {key: getattr(self, key) for key in self.FIELDS}
+        # 保持预设文件中随机seed的写法不变
+        if data["seed"] is None:
+            data["seed"] = "RANDOM"
+        return data
 
     def save(self):
         os.makedirs("comfyui_presets", exist_ok=True)
-        with open(f"comfyui_presets/{self.presets_name}.json", "w", encoding="utf-8") as f:
-            json.dump(self.__dict__, f, ensure_ascii=False, indent=4)
+        path = f"comfyui_presets/{self.presets_name}.json"
+        # 先写临时文件再替换，避免写入中断留下损坏的预设
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_json_dumps(self.to_dict()))
+        os.replace(tmp, path)
+        # 部分文件系统的mtime精度较粗，保存后主动让列表缓存失效
+        ComfyUISettings._cache["mtime"] = -1
 
     @classmethod
     def load(cls, name):
-        with open(f"comfyui_presets/{name}.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
+        # 只加载预设目录中实际存在的预设，同时避免name中的路径穿越
+        path = cls._cache["paths"].get(name) or cls._preset_paths().get(name)
+        if path is None:
+            raise FileNotFoundError(f"预设不存在: {name}")
+        with open(path, "rb") as f:
+            data = _json_loads(f.read())
         return cls(data)
 
+    @classmethod
+    def delete(cls, name):
+        """删除指定预设，返回是否删除成功。"""
+        path = cls._preset_paths().get(name)
+        if path is None:
+            return False
+        os.remove(path)
+        cls._cache["mtime"] = -1
+        return True
+
     @classmethod
     def list_presets(cls):
-        if not os.path.exists("comfyui_presets"):
-            return []
-        return [f.replace(".json", "") for f in os.listdir("comfyui_presets") if f.endswith(".json")]
+        return list(cls._preset_paths())
+
+    @classmethod
+    def _preset_paths(cls):
+        """返回 {预设名: 文件路径}，目录未变化时直接返回上次的扫描结果。"""
+        try:
+            mtime = os.stat(cls.SETTINGS_DIR).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if mtime != cls._cache["mtime"]:
+            with os.scandir(cls.SETTINGS_DIR) as it:
+                cls._cache["paths"] = {e.name[:-5]: e.path for e in it if e.is_file() and e.name.endswith(".json")}
+            cls._cache["mtime"] = mtime
+        return cls._cache["paths"]
 
             
-def api_system_stats(URL):
+def api_system_stats(URL, force=False):
+    # 短时间内重复查询同一地址时直接返回缓存结果，force=True 时跳过缓存
+    cached = _stats_cache.get(URL)
+    if not force and cached and time.monotonic() - cached[0] < _STATS_TTL:
+        return cached[1]
+
     try:
-        response = requests.get(URL+"api/system_stats")
+        response = _SESSION.get(URL+"api/system_stats", timeout=(2, 5))
 
         if response.status_code == 200:
-            return response.json()
+            stats = response.json()
         else:
             print(f"Error: {response.status_code} - {response.text}")
-            return None
+            stats = None
     except requests.RequestException as e:
-        return None
+        stats = None
 
+    # 只缓存成功的结果，ComfyUI刚启动时可以立即重新检测到
+    if stats is not None:
+        _stats_cache[URL] = (time.monotonic(), stats)
+    return stats
 
-def send_workflow(BASE_URL,comfyui_settings: ComfyUISettings,prompt: str):
+
+def _specialize(comfyui_settings: ComfyUISettings):
+    """
+    按设置预先填充工作流中除prompt（以及随机seed）之外的所有占位符。
+    返回 (工作流, 每次发送时仍需填充的占位符位置)。
+    """
     if comfyui_settings.lora == "" or comfyui_settings.lora == None:
-        with open("workflows/base.json", "r",encoding="utf-8") as f:
-            workflow_str = f.read()
+        template, patches = _load_template("workflows/base.json")
     else:
-        with open("workflows/base-lora.json", "r",encoding="utf-8") as f:
-            workflow_str = f.read()
+        template, patches = _load_template("workflows/base-lora.json")
+    workflow_json = copy.deepcopy(template)
 
-    workflow_str = workflow_str.replace("%CHECKPOINT%", comfyui_settings.checkpoint)
-    workflow_str = workflow_str.replace("%LORA%", comfyui_settings.lora)
+    random_seed = comfyui_settings.seed is None
+    dynamic = []
+    for field, node, key in patches:
+        if field == "prompt" or (field == "seed" and random_seed):
+            dynamic.append((field, node, key))
+        else:
+            workflow_json[node]["inputs"][key] = getattr(comfyui_settings, field)
+    return workflow_json, dynamic
 
-    workflow_str = workflow_str.replace("%PROMPT%", json.dumps(prompt)[1:-1])
 
-    workflow_str = workflow_str.replace("%WIDTH%", str(comfyui_settings.latent_width))
-    workflow_str = workflow_str.replace("%HEIGHT%", str(comfyui_settings.latent_height))
-    workflow_str = workflow_str.replace("%BATCH_SIZE%", str(comfyui_settings.batch_size))
+def _build_payload(comfyui_settings: ComfyUISettings, prompt: str):
+    """根据设置和prompt构建提交给ComfyUI的请求体。"""
+    if comfyui_settings._specialized is None:
+        comfyui_settings._specialized = _specialize(comfyui_settings)
+    template, dynamic = comfyui_settings._specialized
+
+    # 只复制需要修改的节点，其余节点与缓存共享（请求体只读）
+    workflow_json = dict(template)
+    for field, node, key in dynamic:
+        value = prompt if field == "prompt" else _getrandbits(31)
+        node_data = workflow_json[node] = dict(workflow_json[node])
+        node_data["inputs"] = dict(node_data["inputs"])
+        node_data["inputs"][key] = value
+
+    return {"prompt": workflow_json}
+
+
+def send_workflow(BASE_URL,comfyui_settings: ComfyUISettings,prompt: str):
+    """发送单个prompt，成功时返回True。"""
+    return _post_payload(BASE_URL, _build_payload(comfyui_settings, prompt))
+
+
+def send_workflows(BASE_URL, items, max_workers=8):
+    """
+    批量发送多个prompt，items为 (ComfyUISettings, prompt) 的可迭代对象。
+    请求体先在当前线程构建好，再由线程池通过共享的连接池并发发送。
+    返回与items顺序一致的发送结果列表。
+    """
+    return post_payloads(BASE_URL, build_payloads(items), max_workers)
+
+
+def build_payloads(items):
+    """
+    为 (ComfyUISettings, prompt) 列表构建请求体。
+    会读取并缓存设置对象的状态，应在修改这些设置的线程（如Tk主线程）中调用。
+    """
+    return [_build_payload(comfyui_settings, prompt) for comfyui_settings, prompt in items]
 
-    if comfyui_settings.seed == "RANDOM" or comfyui_settings.seed == -1 or comfyui_settings.seed == "-1":
-        workflow_str = workflow_str.replace("%SEED%", str(random.randint(0, 2**31 - 1)))
-    else:
-        workflow_str = workflow_str.replace("%SEED%", str(comfyui_settings.seed))
-    workflow_str = workflow_str.replace("%STEPS%", str(comfyui_settings.steps))
-    workflow_str = workflow_str.replace("%CFG%", str(comfyui_settings.cfg))
 
+def post_payloads(BASE_URL, payloads, max_workers=8):
+    """通过线程池并发发送已构建好的请求体，返回与payloads顺序一致的发送结果列表。"""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(functools.partial(_post_payload, BASE_URL), payloads))
 
-    workflow_json = json.loads(workflow_str)
 
-    response = requests.post(BASE_URL+"prompt", json={"prompt": workflow_json})
+def _post_payload(BASE_URL, payload):
+    try:
+        response = _SESSION.post(BASE_URL+"prompt", json=payload, timeout=(2, 30))
+    except requests.RequestException as e:
+        print(f"Error: {e}")
+        return False
 
     # Check for successful response and process results
     if response.status_code == 200:
         print("Workflow sent successfully!")
+        return True
 
     else:
         print(f"Error: {response.status_code} - {response.text}")
+        return False
+
+
+async def send_workflow_async(session, base_url, comfyui_settings: ComfyUISettings, prompt: str):
+    """
+    send_workflow的异步版本，session为调用方共享的aiohttp.ClientSession。
+    可配合asyncio.gather并发提交多个prompt。
+    与send_workflow一致：使用相同的超时，出错时打印错误，返回是否发送成功。
+    """
+    import aiohttp  # 仅异步发送需要，调用方传入session时必然已安装
+
+    payload = _build_payload(comfyui_settings, prompt)
+    timeout = aiohttp.ClientTimeout(sock_connect=2, sock_read=30)
+    try:
+        async with session.post(base_url+"prompt", json=payload, timeout=timeout) as response:
+            if response.status == 200:
+                print("Workflow sent successfully!")
+                return True
+            print(f"Error: {response.status} - {await response.text()}")
+            return False
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Error: {e}")
+        return False
 
 def get_sample():
     pass
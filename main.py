@@ -1,45 +1,19 @@
 import tkinter as tk
 from tkinter import messagebox
 import os
+import copy
+import functools
+import hashlib
 import json
 import webbrowser
 import ttkbootstrap as ttkb
 from ttkbootstrap.constants import *
-from comfyui import ComfyUISettings, send_workflow, api_system_stats
+from concurrent.futures import ThreadPoolExecutor
+from comfyui import ComfyUISettings, build_payloads, post_payloads, api_system_stats
+from comfyui import _json_dumps, _json_loads
 
-
-
-def auto_close_message(parent, title, message, timeout=1200):
-    """
-    创建一个在指定时间后自动关闭的消息弹窗，并居中于父窗口。
-
-    Args:
-        parent (tk.Toplevel or tk.Tk): 父窗口，弹窗将在此之上居中。
-        title (str): 弹窗的标题。
-        message (str): 弹窗显示的消息。
-        timeout (int, optional): 弹窗显示的毫秒数。默认为 1200ms。
-    """
-    popup = tk.Toplevel(parent)
-    popup.title(title)
-    popup.geometry("300x100")
-    popup.attributes("-topmost", True)
-    
-    # 使用ttkbootstrap样式
-    ttkb.Label(popup, text=message, padding=(20, 20)).pack(expand=True, fill="both")
-
-    # 计算并设置居中位置
-    popup.update_idletasks()
-    parent_x = parent.winfo_rootx()
-    parent_y = parent.winfo_rooty()
-    parent_w = parent.winfo_width()
-    parent_h = parent.winfo_height()
-    popup_w = popup.winfo_width()
-    popup_h = popup.winfo_height()
-    x = parent_x + (parent_w - popup_w) // 2
-    y = parent_y + (parent_h - popup_h) // 2
-    popup.geometry(f"+{x}+{y}")
-
-    popup.after(timeout, popup.destroy)
+# 执行网络请求等耗时操作的后台线程池，避免阻塞Tk主线程
+_executor = ThreadPoolExecutor(max_workers=4)
 
 
 class DataManager:
@@ -47,21 +21,117 @@ class DataManager:
     处理所有文件I/O操作，如加载和保存JSON配置文件。
     """
     GENERATED_PROMPTS_FILE = "./prompts/generated_prompts.json"
+    GENERATED_PROMPTS_LOG = "./prompts/generated_prompts.log"
     PROMPT_PRESETS_FILE = "./prompts/prompt_presets.json"
 
+    # 已解析的JSON缓存：{路径: (mtime_ns, 文件大小, 数据, 文件内容摘要)}
+    _json_cache = {}
+
+    @staticmethod
+    def _digest(buf):
+        return hashlib.blake2b(buf, digest_size=16).digest()
+
+    @staticmethod
+    def _load_json(path):
+        """
+        读取JSON文件，文件未变化时直接使用缓存，文件不存在时返回None。
+        调用方会修改返回的数据，因此总是返回副本。
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        cached = DataManager._json_cache.get(path)
+        if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return copy.deepcopy(cached[2])
+
+        with open(path, "rb") as f:
+            buf = f.read()
+        data = _json_loads(buf)
+        DataManager._json_cache[path] = (st.st_mtime_ns, st.st_size, data, DataManager._digest(buf))
+        return copy.deepcopy(data)
+
+    @staticmethod
+    def _save_json(path, data):
+        """
+        保存JSON文件，并用刚写入的数据更新缓存。
+        内容与磁盘上的文件相同时跳过写入；写入时先写临时文件再替换，避免中断后留下损坏的文件。
+        """
+        buf = _json_dumps(data)
+        digest = DataManager._digest(buf)
+        cached = DataManager._json_cache.get(path)
+        if cached and cached[3] == digest:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                st = None
+            if st and cached[:2] == (st.st_mtime_ns, st.st_size):
+                return
+
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(buf)
+        os.replace(tmp, path)
+        st = os.stat(path)
+        DataManager._json_cache[path] = (st.st_mtime_ns, st.st_size, copy.deepcopy(data), digest)
+
     @staticmethod
     def load_generated_prompts():
-        """从JSON文件加载已生成的prompt串。"""
-        if os.path.exists(DataManager.GENERATED_PROMPTS_FILE):
-            with open(DataManager.GENERATED_PROMPTS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {}
+        """从JSON快照加载已生成的prompt串，并重放增量日志中的修改。"""
+        data = DataManager._load_json(DataManager.GENERATED_PROMPTS_FILE)
+        if data is None:
+            data = {}
+
+        if os.path.exists(DataManager.GENERATED_PROMPTS_LOG):
+            with open(DataManager.GENERATED_PROMPTS_LOG, "rb") as f:
+                for line in f:
+                    try:
+                        record = _json_loads(line)
+                    except ValueError:
+                        continue  # 跳过写入中断留下的不完整行
+                    if record["op"] == "put":
+                        data[record["key"]] = record["val"]
+                    else:
+                        data.pop(record["key"], None)
+        return data
 
     @staticmethod
     def save_generated_prompts(data):
-        """将生成的prompt串保存到JSON文件。"""
-        with open(DataManager.GENERATED_PROMPTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """将生成的prompt串完整保存为JSON快照，并清空增量日志。"""
+        DataManager._save_json(DataManager.GENERATED_PROMPTS_FILE, data)
+        if os.path.exists(DataManager.GENERATED_PROMPTS_LOG):
+            os.remove(DataManager.GENERATED_PROMPTS_LOG)
+
+    @staticmethod
+    def append_generated_ops(ops):
+        """
+        将对已生成prompt串的修改追加到增量日志，避免每次都重写整个文件。
+
+        Args:
+            ops (list): (op, key, value) 列表，op 为 "put" 或 "del"。
+        """
+        buf = b"".join(_json_dumps({"op": op, "key": key, "val": val}, indent=False) + b"\n" for op, key, val in ops)
+        with open(DataManager.GENERATED_PROMPTS_LOG, "a+b") as f:
+            # 上次写入中断时末尾没有换行，先补上，避免新记录与残行粘连
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    buf = b"\n" + buf
+            f.write(buf)
+
+    @staticmethod
+    def compact_generated_prompts():
+        """增量日志大于快照时，将其合并进快照。"""
+        try:
+            log_size = os.path.getsize(DataManager.GENERATED_PROMPTS_LOG)
+        except FileNotFoundError:
+            return
+        try:
+            snapshot_size = os.path.getsize(DataManager.GENERATED_PROMPTS_FILE)
+        except FileNotFoundError:
+            snapshot_size = 0
+        if log_size > snapshot_size:
+            DataManager.save_generated_prompts(DataManager.load_generated_prompts())
 
     @staticmethod
     def load_prompt_presets():
@@ -72,10 +142,9 @@ class DataManager:
         default_categories = ["quality", "style", "character", "pose", "extra"]
         data = {cat: [] for cat in default_categories}
 
-        if os.path.exists(DataManager.PROMPT_PRESETS_FILE):
-            try:
-                with open(DataManager.PROMPT_PRESETS_FILE, 'r', encoding='utf-8') as f:
-                    loaded_data = json.load(f)
+        try:
+            loaded_data = DataManager._load_json(DataManager.PROMPT_PRESETS_FILE)
+            if loaded_data is not None:
                 for cat in default_categories:
                     if cat in loaded_data:
                         # 兼容性检查：如果旧格式是字符串列表，则转换为新格式
@@ -83,15 +152,14 @@ class DataManager:
                             data[cat] = [{"name": v, "value": v} for v in loaded_data[cat]]
                         else:
                             data[cat] = loaded_data[cat]
-            except (json.JSONDecodeError, IndexError) as e:
-                messagebox.showerror("错误", f"加载 prompt_presets.json失败: {e}")
+        except (json.JSONDecodeError, IndexError) as e:
+            messagebox.showerror("错误", f"加载 prompt_presets.json失败: {e}")
         return data
 
     @staticmethod
     def save_prompt_presets(data):
         """将Prompt预设保存到JSON文件。"""
-        with open(DataManager.PROMPT_PRESETS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        DataManager._save_json(DataManager.PROMPT_PRESETS_FILE, data)
 
 
 class MainApp(ttkb.Window):
@@ -102,6 +170,15 @@ class MainApp(ttkb.Window):
     PROMPT_CATEGORIES = ["quality", "style", "character", "pose"]
     EXTRA_CATEGORY = "extra"
     ALL_CATEGORIES = PROMPT_CATEGORIES + [EXTRA_CATEGORY]
+    # 自动关闭弹窗的固定尺寸
+    POPUP_WIDTH, POPUP_HEIGHT = 300, 100
+
+    # ComfyUI设置各字段的类型与默认值
+    _FIELD_TYPES = ComfyUISettings.FIELD_TYPES
+    _FIELD_DEFAULTS = ComfyUISettings().to_dict()
+
+    # 各类别的 (分组标题, 选择标签)
+    _CATEGORY_LABELS = {c: (f"🎯 {c.capitalize()} Prompt", f"选择{c}:") for c in PROMPT_CATEGORIES}
     
     # 定义生成prompt时各部分的拼接顺序
     PROMPT_VALUE_ORDER = ["quality", "style", "character", "pose", "extra"]
@@ -113,8 +190,13 @@ class MainApp(ttkb.Window):
         self.geometry("900x850")
         
         # --- 状态变量初始化 ---
-        self.generated_prompts = DataManager.load_generated_prompts()
-        self.prompt_presets = DataManager.load_prompt_presets()
+        # prompt数据在首次访问时才加载，见 generated_prompts / prompt_presets 属性
+        self._generated_prompts = None
+        self._prompt_presets = None
+        self._prompts_loaded = False  # Prompt管理选项卡是否已填充数据
+        # 按名称索引的预设：{类别: {名称: 预设}}，与 prompt_presets 保持同步，经 preset_index / prompt_values 属性访问
+        self._preset_index = {}
+        self._prompt_values = {}
         self.comfyui_settings = ComfyUISettings()
 
         # Tkinter变量，用于绑定UI控件
@@ -127,18 +209,64 @@ class MainApp(ttkb.Window):
         self.prompt_comboboxes = {}
         self.prompt_entries = {}
         self.comfyui_entries = {}
+        self._listbox_items = {}  # 各Listbox当前显示的内容，用于跳过无变化的刷新
+        self._combo_names = {}  # 各Combobox当前的选项
+        self._menu_names = None  # ComfyUI预设菜单当前的选项
+        self._gen_index = {}  # 已生成prompt的key -> 在列表中的位置
+
+        # 延迟保存：短时间内的多次修改合并为一次写入
+        self._pending_save = {"presets": None, "generated": None}  # after() 的任务id
+        self._pending_ops = []  # 尚未写入日志的已生成prompt修改
+        self.protocol("WM_DELETE_WINDOW", self._flush_and_quit)
+
+        # 复用的自动关闭消息弹窗，见 auto_close_message
+        self._popup = None
+        self._popup_label = None
+        self._popup_after_id = None
+        self._popup_parent_geometry = None
         
         # --- 构建UI界面 ---
         self._build_ui()
         self._initial_load()
 
+    @property
+    def generated_prompts(self):
+        """已生成的prompt串，首次访问时从文件加载。"""
+        if self._generated_prompts is None:
+            DataManager.compact_generated_prompts()
+            self._generated_prompts = DataManager.load_generated_prompts()
+        return self._generated_prompts
+
+    @property
+    def prompt_presets(self):
+        """Prompt预设，首次访问时从文件加载并建立索引。"""
+        if self._prompt_presets is None:
+            self._prompt_presets = DataManager.load_prompt_presets()
+            self._rebuild_preset_index()
+        return self._prompt_presets
+
+    @property
+    def preset_index(self):
+        """按名称索引的预设 {类别: {名称: 预设}}，必要时先加载 prompt_presets。"""
+        self.prompt_presets
+        return self._preset_index
+
+    @property
+    def prompt_values(self):
+        """生成prompt时使用的值 {类别: {名称: 值}}，必要时先加载 prompt_presets。"""
+        self.prompt_presets
+        return self._prompt_values
+
     def _build_ui(self):
         """构建主界面，包含多个选项卡。"""
         notebook = ttkb.Notebook(self, bootstyle="primary")
         notebook.pack(fill="both", expand=True, padx=10, pady=10)
+        # 切换到Prompt管理选项卡时才加载prompt数据（启动时默认选中，窗口显示后触发）
+        notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+        self.notebook = notebook
 
         # 创建各个选项卡
-        prompt_tab = self._build_prompt_tab(notebook)
+        prompt_tab = self.prompt_tab = self._build_prompt_tab(notebook)
         comfyui_settings_tab = self._build_comfyui_settings_tab(notebook)
         comfyui_connect_tab = self._build_comfyui_connect_tab(notebook)
         about_tab = self._build_about_tab(notebook)
@@ -151,7 +279,6 @@ class MainApp(ttkb.Window):
 
     def _initial_load(self):
         """在UI构建完成后，加载初始数据并刷新界面。"""
-        self.refresh_generated_listbox()
         self.load_comfyui_presets()
         # 绑定ComfyUI预设下拉菜单的变动事件
         self.comfyui_preset_var.trace_add("write", self.on_comfyui_preset_change)
@@ -159,6 +286,83 @@ class MainApp(ttkb.Window):
         if self.comfyui_preset_var.get():
             self.load_comfyui_preset(self.comfyui_preset_var.get())
 
+    def _schedule_save(self, kind):
+        """在最后一次修改约250ms后保存，kind 为 "presets" 或 "generated"。"""
+        if self._pending_save[kind]:
+            self.after_cancel(self._pending_save[kind])
+        self._pending_save[kind] = self.after(250, self._flush_save, kind)
+
+    def _flush_save(self, kind):
+        """立即写入指定类型的待保存数据。"""
+        self._pending_save[kind] = None
+        if kind == "presets":
+            DataManager.save_prompt_presets(self.prompt_presets)
+        elif self._pending_ops:
+            DataManager.append_generated_ops(self._pending_ops)
+            self._pending_ops = []
+
+    def _flush_and_quit(self):
+        """关闭窗口前写入所有待保存的数据。"""
+        for kind, after_id in self._pending_save.items():
+            if after_id:
+                self.after_cancel(after_id)
+                self._flush_save(kind)
+        self.destroy()
+
+    def _on_tab_changed(self, event):
+        """选项卡切换时，若切换到Prompt管理选项卡则确保数据已加载。"""
+        if self.notebook.select() == str(self.prompt_tab):
+            self._ensure_prompts_loaded()
+
+    def _ensure_prompts_loaded(self):
+        """加载prompt数据并填充Prompt管理选项卡，只执行一次。"""
+        if self._prompts_loaded:
+            return
+        self._prompts_loaded = True
+        for cat in self.ALL_CATEGORIES:
+            self.refresh_prompt_ui(cat)
+        self.refresh_generated_listbox()
+
+    def auto_close_message(self, title, message, timeout=1200):
+        """
+        显示一个在指定时间后自动关闭的消息弹窗，并居中于主窗口。
+        弹窗在首次使用时创建，之后只隐藏/显示并复用。
+
+        Args:
+            title (str): 弹窗的标题。
+            message (str): 弹窗显示的消息。
+            timeout (int, optional): 弹窗显示的毫秒数。默认为 1200ms。
+        """
+        if self._popup is None:
+            self._popup = tk.Toplevel(self)
+            self._popup.geometry(f"{self.POPUP_WIDTH}x{self.POPUP_HEIGHT}")
+            self._popup.attributes("-topmost", True)
+            self._popup.protocol("WM_DELETE_WINDOW", self._popup.withdraw)
+
+            # 使用ttkbootstrap样式
+            self._popup_label = ttkb.Label(self._popup, padding=(20, 20))
+            self._popup_label.pack(expand=True, fill="both")
+        else:
+            if self._popup_after_id:
+                self._popup.after_cancel(self._popup_after_id)
+            self._popup.deiconify()
+            self._popup.lift()
+
+        self._popup.title(title)
+        self._popup_label.configure(text=message)
+
+        # 计算并设置居中位置，主窗口未移动或缩放时沿用上次的位置
+        parent_geometry = (self.winfo_rootx(), self.winfo_rooty(), self.winfo_width(), self.winfo_height())
+        if parent_geometry != self._popup_parent_geometry:
+            # 弹窗尺寸固定，无需 update_idletasks 再查询实际大小
+            parent_x, parent_y, parent_w, parent_h = parent_geometry
+            x = parent_x + (parent_w - self.POPUP_WIDTH) // 2
+            y = parent_y + (parent_h - self.POPUP_HEIGHT) // 2
+            self._popup.geometry(f"+{x}+{y}")
+            self._popup_parent_geometry = parent_geometry
+
+        self._popup_after_id = self._popup.after(timeout, self._popup.withdraw)
+
     # ===================================================================
     # UI构建辅助方法
     # ===================================================================
@@ -187,18 +391,18 @@ class MainApp(ttkb.Window):
 
     def _create_prompt_category_ui(self, parent, cat):
         """为单个prompt类别（如quality, style）创建UI组件。"""
-        frame = ttkb.Labelframe(parent, text=f"🎯 {cat.capitalize()} Prompt", padding=10)
+        frame_text, label_text = self._CATEGORY_LABELS[cat]
+        frame = ttkb.Labelframe(parent, text=frame_text, padding=10)
         frame.pack(fill="x", pady=5, padx=5)
         frame.grid_columnconfigure(1, weight=1)
 
-        ttkb.Label(frame, text=f"选择{cat}:").grid(row=0, column=0, padx=5, sticky="w")
+        ttkb.Label(frame, text=label_text).grid(row=0, column=0, padx=5, sticky="w")
         
-        names = [p["name"] for p in self.prompt_presets[cat]]
-        combo = ttkb.Combobox(frame, textvariable=self.prompt_vars[cat], values=names, state="readonly")
+        combo = ttkb.Combobox(frame, textvariable=self.prompt_vars[cat], state="readonly")
         combo.grid(row=0, column=1, padx=5, sticky="ew")
         
         # 绑定事件和存储引用
-        combo.bind("<<ComboboxSelected>>", lambda e, c=cat: self.on_prompt_selected(e, c))
+        combo.bind("<<ComboboxSelected>>", functools.partial(self.on_prompt_selected, category=cat))
         self.prompt_comboboxes[cat] = combo
 
         name_entry = ttkb.Entry(frame)
@@ -206,22 +410,15 @@ class MainApp(ttkb.Window):
         val_entry = ttkb.Entry(frame)
         val_entry.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
         
-        # --- FIX START ---
-        # 修正：必须先将Entry控件存入字典...
+        # 选项由 _ensure_prompts_loaded 在数据加载后填充
         self.prompt_entries[cat] = (name_entry, val_entry)
         
-        # ...然后再调用on_prompt_selected，因为它会使用这个字典
-        if names:
-            self.prompt_vars[cat].set(names[0])
-            self.on_prompt_selected(None, cat)
-        # --- FIX END ---
-        
         # 按钮
         btn_frame = ttkb.Frame(frame)
         btn_frame.grid(row=0, column=2, rowspan=2, padx=5)
-        ttkb.Button(btn_frame, text="新增", command=lambda c=cat: self.add_prompt(c), bootstyle="success-outline").pack(fill="x", pady=1)
-        ttkb.Button(btn_frame, text="修改", command=lambda c=cat: self.edit_prompt(c), bootstyle="warning-outline").pack(fill="x", pady=1)
-        ttkb.Button(btn_frame, text="删除", command=lambda c=cat: self.delete_prompt(c), bootstyle="danger-outline").pack(fill="x", pady=1)
+        ttkb.Button(btn_frame, text="新增", command=functools.partial(self.add_prompt, cat), bootstyle="success-outline").pack(fill="x", pady=1)
+        ttkb.Button(btn_frame, text="修改", command=functools.partial(self.edit_prompt, cat), bootstyle="warning-outline").pack(fill="x", pady=1)
+        ttkb.Button(btn_frame, text="删除", command=functools.partial(self.delete_prompt, cat), bootstyle="danger-outline").pack(fill="x", pady=1)
 
     def _create_extra_category_ui(self, parent):
         """为'extra'类别（多选）创建UI组件。"""
@@ -239,9 +436,7 @@ class MainApp(ttkb.Window):
         scrollbar.pack(side="right", fill="y")
         self.extra_listbox.config(yscrollcommand=scrollbar.set)
         
-        for p in self.prompt_presets[cat]:
-            self.extra_listbox.insert("end", p["name"])
-        self.extra_listbox.bind("<<ListboxSelect>>", lambda e, c=cat: self.on_prompt_selected(e, c))
+        self.extra_listbox.bind("<<ListboxSelect>>", functools.partial(self.on_prompt_selected, category=cat))
 
         name_entry = ttkb.Entry(frame)
         name_entry.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
@@ -255,9 +450,9 @@ class MainApp(ttkb.Window):
         # 按钮
         btn_frame = ttkb.Frame(frame)
         btn_frame.grid(row=0, column=2, rowspan=2, padx=5)
-        ttkb.Button(btn_frame, text="新增", command=lambda c=cat: self.add_prompt(c), bootstyle="success-outline").pack(fill="x", pady=1)
-        ttkb.Button(btn_frame, text="修改", command=lambda c=cat: self.edit_prompt(c), bootstyle="warning-outline").pack(fill="x", pady=1)
-        ttkb.Button(btn_frame, text="删除", command=lambda c=cat: self.delete_prompt(c), bootstyle="danger-outline").pack(fill="x", pady=1)
+        ttkb.Button(btn_frame, text="新增", command=functools.partial(self.add_prompt, cat), bootstyle="success-outline").pack(fill="x", pady=1)
+        ttkb.Button(btn_frame, text="修改", command=functools.partial(self.edit_prompt, cat), bootstyle="warning-outline").pack(fill="x", pady=1)
+        ttkb.Button(btn_frame, text="删除", command=functools.partial(self.delete_prompt, cat), bootstyle="danger-outline").pack(fill="x", pady=1)
 
     def _create_generation_ui(self, parent):
         """创建右侧的prompt生成、预览和发送区域UI。"""
@@ -364,14 +559,29 @@ class MainApp(ttkb.Window):
         else:
             selected_name = self.prompt_vars[category].get()
 
-        for preset in self.prompt_presets[category]:
-            if preset["name"] == selected_name:
-                name_entry, val_entry = self.prompt_entries[category]
-                name_entry.delete(0, tk.END)
-                name_entry.insert(0, preset["name"])
-                val_entry.delete(0, tk.END)
-                val_entry.insert(0, preset["value"])
-                break
+        preset = self.preset_index[category].get(selected_name)
+        if preset:
+            name_entry, val_entry = self.prompt_entries[category]
+            name_entry.delete(0, tk.END)
+            name_entry.insert(0, preset["name"])
+            val_entry.delete(0, tk.END)
+            val_entry.insert(0, preset["value"])
+
+    def _preset_position(self, category, name):
+        """返回预设在类别列表中的位置（即在控件中的行号），不存在时返回None。"""
+        presets = self.prompt_presets[category]
+        for i, preset in enumerate(presets):
+            if preset["name"] == name:
+                return i
+        return None
+
+    def _rebuild_preset_index(self, category=None):
+        """重建指定类别（默认全部）的名称索引和prompt值，在修改 prompt_presets 后调用。"""
+        categories = [category] if category else self.prompt_presets.keys()
+        for cat in categories:
+            self._preset_index[cat] = {p["name"]: p for p in self.prompt_presets[cat]}
+            # 生成prompt时使用的值，预先去掉首尾逗号
+            self._prompt_values[cat] = {p["name"]: p["value"].strip(",") for p in self.prompt_presets[cat]}
     
     def _get_selected_preset_name(self, category):
         """辅助方法，获取指定类别中当前选中的预设名称。"""
@@ -390,15 +600,16 @@ class MainApp(ttkb.Window):
         if not name or not value:
             messagebox.showwarning("输入无效", "名称和内容都不能为空。")
             return
-        if any(p["name"] == name for p in self.prompt_presets[category]):
+        if name in self.preset_index[category]:
             messagebox.showwarning("名称重复", "该名称的预设已存在。")
             return
 
         self.prompt_presets[category].append({"name": name, "value": value})
         self.prompt_presets[category].sort(key=lambda p: p["name"].lower())  # 自动排序
-        DataManager.save_prompt_presets(self.prompt_presets)
+        self._rebuild_preset_index(category)
+        self._schedule_save("presets")
         self.refresh_prompt_ui(category)
-        auto_close_message(self, "成功", f"已新增预设: {name}")
+        self.auto_close_message("成功", f"已新增预设: {name}")
 
     def edit_prompt(self, category):
         """修改选中的prompt预设。"""
@@ -418,18 +629,20 @@ class MainApp(ttkb.Window):
             return
 
         # 检查新名称是否与其它预设冲突
-        if new_name != selected_name and any(p["name"] == new_name for p in self.prompt_presets[category]):
+        if new_name != selected_name and new_name in self.preset_index[category]:
             messagebox.showwarning("名称重复", "修改后的名称与其它预设冲突。")
             return
         
-        for i, preset in enumerate(self.prompt_presets[category]):
-            if preset["name"] == selected_name:
-                self.prompt_presets[category][i] = {"name": new_name, "value": new_value}
-                self.prompt_presets[category].sort(key=lambda p: p["name"].lower())  # 自动排序
-                DataManager.save_prompt_presets(self.prompt_presets)
+        i = self._preset_position(category, selected_name)
+        if i is not None:
+            self.prompt_presets[category][i] = {"name": new_name, "value": new_value}
+            self.prompt_presets[category].sort(key=lambda p: p["name"].lower())  # 自动排序
+            self._rebuild_preset_index(category)
+            self._schedule_save("presets")
+            # 只修改了内容时列表和输入框都无需刷新
+            if new_name != selected_name:
                 self.refresh_prompt_ui(category, new_name)
-                auto_close_message(self, "成功", f"已修改预设: {new_name}")
-                return
+            self.auto_close_message("成功", f"已修改预设: {new_name}")
 
     def delete_prompt(self, category):
         """删除选中的prompt预设。"""
@@ -446,20 +659,21 @@ class MainApp(ttkb.Window):
         self.prompt_presets[category] = [p for p in self.prompt_presets[category] if p["name"] not in selected_names]
         
         if len(self.prompt_presets[category]) < initial_count:
-            DataManager.save_prompt_presets(self.prompt_presets)
+            self._rebuild_preset_index(category)
+            self._schedule_save("presets")
             self.refresh_prompt_ui(category)
-            auto_close_message(self, "成功", "选中的预设已被删除。")
+            self.auto_close_message("成功", "选中的预设已被删除。")
 
     def refresh_prompt_ui(self, category, new_selection=None):
         """刷新指定类别的UI（Combobox或Listbox）。"""
         if category == self.EXTRA_CATEGORY:
-            self.extra_listbox.delete(0, tk.END)
-            for p in self.prompt_presets[category]:
-                self.extra_listbox.insert("end", p["name"])
+            self._fill_listbox(self.extra_listbox, (p["name"] for p in self.prompt_presets[category]))
         else:
-            combo = self.prompt_comboboxes[category]
-            names = [p["name"] for p in self.prompt_presets[category]]
-            combo['values'] = names
+            names = tuple(p["name"] for p in self.prompt_presets[category])
+            # 选项未变化时不重新设置，避免Tk重建下拉列表
+            if self._combo_names.get(category) != names:
+                self.prompt_comboboxes[category]['values'] = names
+                self._combo_names[category] = names
             
             if new_selection and new_selection in names:
                 self.prompt_vars[category].set(new_selection)
@@ -471,54 +685,43 @@ class MainApp(ttkb.Window):
 
     def generate_prompt_string(self):
         """根据当前选择生成prompt key和value，并保存。"""
-        # 1. 组合Prompt值 (按指定顺序)
-        prompt_parts = []
+        # 1. 收集各类别选中的预设名称（extra为多选）
+        selected = {}
         for cat in self.PROMPT_VALUE_ORDER:
             if cat == self.EXTRA_CATEGORY:
-                selected_indices = self.extra_listbox.curselection()
-                for i in selected_indices:
-                    name = self.extra_listbox.get(i)
-                    value = next((p["value"] for p in self.prompt_presets[cat] if p["name"] == name), None)
-                    if value: prompt_parts.append(value.strip(","))
+                selected[cat] = [self.extra_listbox.get(i) for i in self.extra_listbox.curselection()]
             else:
-                selected_name = self.prompt_vars[cat].get()
-                if selected_name:
-                    value = next((p["value"] for p in self.prompt_presets[cat] if p["name"] == selected_name), None)
-                    if value: prompt_parts.append(value.strip(","))
-        
-        full_prompt = ", ".join(filter(None, prompt_parts))
+                name = self.prompt_vars[cat].get()
+                selected[cat] = [name] if name else []
 
-        # 2. 组合Prompt Key (按另一指定顺序)
-        key_parts = []
-        for cat in self.PROMPT_KEY_ORDER:
-            if cat == self.EXTRA_CATEGORY:
-                selected_indices = self.extra_listbox.curselection()
-                if selected_indices:
-                    extras = [self.extra_listbox.get(i) for i in selected_indices]
-                    key_parts.append("-".join(extras))
-            else:
-                key_parts.append(self.prompt_vars[cat].get())
-        
-        final_key = "-".join(filter(None, key_parts))
+        # 2. 组合Prompt值 (按指定顺序)
+        values = self.prompt_values
+        full_prompt = ", ".join(filter(None, (
+            values[cat].get(name) for cat in self.PROMPT_VALUE_ORDER for name in selected[cat]
+        )))
+
+        # 3. 组合Prompt Key (按另一指定顺序)
+        final_key = "-".join(filter(None, ("-".join(selected[cat]) for cat in self.PROMPT_KEY_ORDER)))
         
         if not final_key:
             messagebox.showwarning("无法生成", "请至少选择一个Prompt预设。")
             return
 
-        # 3. 保存和刷新UI
+        # 4. 保存和刷新UI
         self.generated_prompts[final_key] = full_prompt
-        DataManager.save_generated_prompts(self.generated_prompts)
+        self._pending_ops.append(("put", final_key, full_prompt))
+        self._schedule_save("generated")
         self.refresh_generated_listbox()
 
         # 选中刚生成的项
         try:
-            idx = list(self.generated_prompts.keys()).index(final_key)
+            idx = self._gen_index[final_key]
             self.generated_listbox.selection_clear(0, tk.END)
             self.generated_listbox.selection_set(idx)
             self.generated_listbox.see(idx)
             self.on_generated_select(None)
-            auto_close_message(self, "成功", f"已生成Prompt: {final_key}")
-        except ValueError:
+            self.auto_close_message("成功", f"已生成Prompt: {final_key}")
+        except KeyError:
             pass # 应该不会发生
 
     def delete_generated_prompt(self):
@@ -534,16 +737,27 @@ class MainApp(ttkb.Window):
 
         for key in keys:
             self.generated_prompts.pop(key, None)
-        DataManager.save_generated_prompts(self.generated_prompts)
+        self._pending_ops.extend(("del", key, None) for key in keys)
+        self._schedule_save("generated")
         self.refresh_generated_listbox()
         self.generated_prompt_text.delete("1.0", tk.END)
-        auto_close_message(self, "删除成功", f"已删除 {len(keys)} 个Prompt。")
+        self.auto_close_message("删除成功", f"已删除 {len(keys)} 个Prompt。")
 
     def refresh_generated_listbox(self):
         """刷新右侧的已生成prompt列表。"""
-        self.generated_listbox.delete(0, tk.END)
-        for key in self.generated_prompts.keys():
-            self.generated_listbox.insert(tk.END, key)
+        if self._fill_listbox(self.generated_listbox, self.generated_prompts.keys()):
+            # 记录每个key在列表中的位置，便于直接定位
+            self._gen_index = {key: i for i, key in enumerate(self.generated_prompts)}
+
+    def _fill_listbox(self, listbox, items):
+        """用items整体替换Listbox的内容（单次Tcl调用），内容未变化时跳过。返回是否有变化。"""
+        items = tuple(items)
+        if self._listbox_items.get(str(listbox)) == items:
+            return False
+        listbox.delete(0, tk.END)
+        listbox.insert(tk.END, *items)
+        self._listbox_items[str(listbox)] = items
+        return True
 
     def on_generated_select(self, event):
         """当已生成prompt被选中时，在预览框中显示其内容，并同步左侧选择器。"""
@@ -578,12 +792,12 @@ class MainApp(ttkb.Window):
                     if extra_key:
                         extras = extra_key.split("-")
                         for extra in extras:
-                            for i, p in enumerate(self.prompt_presets[cat]):
-                                if p["name"] == extra:
-                                    self.extra_listbox.selection_set(i)
+                            i = self._preset_position(cat, extra)
+                            if i is not None:
+                                self.extra_listbox.selection_set(i)
                 else:
                     name = parts[idx]
-                    if name in [p["name"] for p in self.prompt_presets[cat]]:
+                    if name in self.preset_index[cat]:
                         self.prompt_vars[cat].set(name)
                         self.on_prompt_selected(None, cat)
 
@@ -595,29 +809,36 @@ class MainApp(ttkb.Window):
 
         sels = self.generated_listbox.curselection()
         if not sels:
-            auto_close_message(self, "提示", "请先选择一个或多个Prompt发送")
+            self.auto_close_message("提示", "请先选择一个或多个Prompt发送")
             return
 
-        count = 0
+        items = []
         for i in sels:
             key = self.generated_listbox.get(i)
             prompt_text = self.generated_prompts.get(key, "")
             if prompt_text:
-                send_workflow(self.comfyui_url_var.get(), self.comfyui_settings, prompt_text)
-                count += 1
+                items.append((self.comfyui_settings, prompt_text))
 
-        auto_close_message(self, "发送成功", f"已发送 {count} 个Prompt")
+        # 请求体在主线程构建（会读取当前设置），只把网络请求放到后台线程并发发送
+        payloads = build_payloads(items)
+        self._run_in_background(
+            post_payloads, self.comfyui_url_var.get(), payloads,
+            callback=lambda results: self.auto_close_message("发送成功", f"已发送 {sum(results)} 个Prompt"),
+        )
 
     # --- ComfyUI 设置相关方法 ---
     def load_comfyui_presets(self):
         """加载所有ComfyUI预设并更新下拉菜单。"""
         presets = ComfyUISettings.list_presets()
-        menu = self.comfyui_menu["menu"]
-        menu.delete(0, "end")
+        # 预设列表未变化时无需重建菜单
+        if tuple(presets) != self._menu_names:
+            menu = self.comfyui_menu["menu"]
+            menu.delete(0, "end")
+            for name in presets:
+                menu.add_command(label=name, command=functools.partial(self.comfyui_preset_var.set, name))
+            self._menu_names = tuple(presets)
         
         if presets:
-            for name in presets:
-                menu.add_command(label=name, command=lambda n=name: self.comfyui_preset_var.set(n))
             self.comfyui_preset_var.set(presets[0])
         else:
             self.comfyui_preset_var.set("无预设")
@@ -626,9 +847,10 @@ class MainApp(ttkb.Window):
     def load_comfyui_preset(self, name):
         """加载指定的ComfyUI预设并更新UI。"""
         self.comfyui_settings = ComfyUISettings.load(name)
+        values = self.comfyui_settings.to_dict()
         for key, entry in self.comfyui_entries.items():
             entry.delete(0, tk.END)
-            entry.insert(0, str(getattr(self.comfyui_settings, key, '')))
+            entry.insert(0, str(values.get(key, '')))
 
     def on_comfyui_preset_change(self, *args):
         """当ComfyUI预设下拉菜单变化时触发。"""
@@ -645,14 +867,10 @@ class MainApp(ttkb.Window):
     def save_comfyui_preset(self):
         """保存当前UI中的ComfyUI设置。"""
         for key, entry in self.comfyui_entries.items():
-            value = entry.get()
-            # 类型转换
-            if key in ["latent_width", "latent_height", "batch_size", "steps", "seed"]:
-                try: value = int(value)
-                except ValueError: value = 0
-            elif key == "cfg":
-                try: value = float(value)
-                except ValueError: value = 7.5
+            # 按字段类型转换，输入无效时使用默认值（seed中"RANDOM"表示随机）
+            type_ = self._FIELD_TYPES.get(key, str)
+            try: value = type_(entry.get())
+            except ValueError: value = self._FIELD_DEFAULTS[key]
             setattr(self.comfyui_settings, key, value)
         
         if not self.comfyui_settings.presets_name:
@@ -662,7 +880,7 @@ class MainApp(ttkb.Window):
         self.comfyui_settings.save()
         self.load_comfyui_presets() # 刷新列表
         self.comfyui_preset_var.set(self.comfyui_settings.presets_name) # 选中刚保存的
-        auto_close_message(self, "成功", "ComfyUI设置已保存！")
+        self.auto_close_message("成功", "ComfyUI设置已保存！")
 
     def delete_comfyui_preset(self):
         """删除当前选中的ComfyUI预设。"""
@@ -672,11 +890,9 @@ class MainApp(ttkb.Window):
             return
         
         if messagebox.askyesno("确认删除", f"确定要删除ComfyUI预设 '{name}' 吗？"):
-            filepath = os.path.join(ComfyUISettings.SETTINGS_DIR, f"{name}.json")
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            if ComfyUISettings.delete(name):
                 self.load_comfyui_presets()
-                auto_close_message(self, "成功", f"已删除预设：{name}")
+                self.auto_close_message("成功", f"已删除预设：{name}")
 
     # --- ComfyUI 连接相关方法 ---
     def check_comfyui_connection(self):
@@ -687,13 +903,32 @@ class MainApp(ttkb.Window):
             self.status_label.config(bootstyle="danger")
             return
 
-        if api_system_stats(url):
+        self.comfyui_status_var.set("⏳ 正在连接...")
+        self.status_label.config(bootstyle="secondary")
+        # 用户主动检测，跳过结果缓存
+        self._run_in_background(functools.partial(api_system_stats, url, force=True), callback=self._on_connection_checked)
+
+    def _on_connection_checked(self, stats):
+        """连接检测完成后（主线程）更新状态显示。"""
+        if stats:
             self.comfyui_status_var.set("✅ 成功连接到 ComfyUI")
             self.status_label.config(bootstyle="success")
         else:
             self.comfyui_status_var.set("❌ 无法连接到 ComfyUI")
             self.status_label.config(bootstyle="danger")
 
+    def _run_in_background(self, func, *args, callback):
+        """在后台线程执行func(*args)，完成后在Tk主线程中调用callback(结果)。"""
+        future = _executor.submit(func, *args)
+
+        def poll():
+            if future.done():
+                callback(future.result())
+            else:
+                self.after(50, poll)
+
+        self.after(50, poll)
+
 # nuitka --mingw64 --enable-plugin=tk-inter --standalone --onefile --show-progress --output-filename=comfyui_presets_util.exe main.py
 if __name__ == "__main__":
     app = MainApp()